@@ -19,20 +19,31 @@
 
 import hashlib
 import logging
-import os.path
-import shutil
-import tempfile
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from urllib.request import urlopen
 
 from momlib import (
     DISTROS,
-    download_source,
     get_pool_distros,
     get_pool_sources,
     get_sources,
     run,
+    source_file_url,
 )
 
 
+# Checksum fields of a source, strongest first
+CHECKSUMS = [
+    ("Checksums-Sha512", "SHA-512", hashlib.sha512),
+    ("Checksums-Sha256", "SHA-256", hashlib.sha256),
+    ("Checksums-Sha1", "SHA-1", hashlib.sha1),
+    ("Files", "MD5", hashlib.md5),
+]
+
+
 def options(parser):
     parser.add_option(
         "-d",
@@ -50,66 +61,85 @@ def options(parser):
         action="append",
         help="Process only these packages",
     )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        type="int",
+        metavar="JOBS",
+        default=os.cpu_count(),
+        help="Number of files to check in parallel",
+    )
 
 
 class Mismatch(Exception):
     pass
 
 
-def check_source(distro, source):
-    tdir = tempfile.mkdtemp()
+def check_file(url, name, checks):
+    """Check a file against all of its expected checksums as it downloads."""
+    hashes = [hasher() for (hashname, hasher, expected_hash) in checks]
+    logging.debug("Downloading %s", url)
     try:
-        download_source(distro, source, tdir)
-        for fieldname, hashname, hasher in (
-            ("Checksums-Sha512", "SHA-512", hashlib.sha512),
-            ("Checksums-Sha256", "SHA-256", hashlib.sha256),
-            ("Checksums-Sha1", "SHA-1", hashlib.sha1),
-            ("Files", "MD5", hashlib.md5),
-        ):
-            if fieldname not in source:
-                continue
-            for entry in source[fieldname].strip("\n").split("\n"):
-                expected_hash, expected_size, name = entry.split(None, 2)
-                with open(os.path.join(tdir, name), "rb") as f:
-                    h = hasher()
-                    for chunk in iter(lambda: f.read(256 * 1024), b""):
-                        h.update(chunk)
-                    if h.hexdigest() != expected_hash:
-                        raise Mismatch(
-                            "%s %s: LP %s != pool %s"
-                            % (name, hashname, h.hexdigest(), expected_hash),
-                        )
-    finally:
-        shutil.rmtree(tdir)
+        with closing(urlopen(url)) as url_f:
+            for chunk in iter(lambda: url_f.read(1024 * 1024), b""):
+                for h in hashes:
+                    h.update(chunk)
+    except OSError:
+        logging.warning("Downloading %s failed", url)
+        raise
+    for (hashname, hasher, expected_hash), h in zip(checks, hashes):
+        if h.hexdigest() != expected_hash:
+            raise Mismatch(
+                "%s %s: LP %s != pool %s"
+                % (name, hashname, h.hexdigest(), expected_hash),
+            )
 
 
-def main(options, args):
-    for distro in get_pool_distros():
-        if options.distro is not None and distro not in options.distro:
+def check_source(distro, source, executor):
+    checks = defaultdict(list)
+    for fieldname, hashname, hasher in CHECKSUMS:
+        if fieldname not in source:
             continue
-        sourcenames = set()
-        for dist in DISTROS[distro]["dists"]:
-            for component in DISTROS[distro]["components"]:
-                for source in get_sources(distro, dist, component):
-                    sourcenames.add(source["Package"])
-        for sourcename in sorted(sourcenames):
-            if (
-                options.package is not None
-                and sourcename not in options.package
-            ):
-                continue
-            try:
-                sources = get_pool_sources(distro, sourcename)
-            except OSError:
+        for entry in source[fieldname].strip("\n").split("\n"):
+            expected_hash, expected_size, name = entry.split(None, 2)
+            checks[name].append((hashname, hasher, expected_hash))
+
+    # The files are only needed for their checksums, so hash them as they
+    # come in rather than saving them first.  hashlib lets go of the GIL
+    # while hashing, so the files of a source can be checked side by side.
+    urls = [source_file_url(distro, source, name) for name in checks]
+    for _ in executor.map(check_file, urls, checks, checks.values()):
+        pass
+
+
+def main(options, args):
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        for distro in get_pool_distros():
+            if options.distro is not None and distro not in options.distro:
                 continue
-            for source_entry in sources:
+            sourcenames = set()
+            for dist in DISTROS[distro]["dists"]:
+                for component in DISTROS[distro]["components"]:
+                    for source in get_sources(distro, dist, component):
+                        sourcenames.add(source["Package"])
+            for sourcename in sorted(sourcenames):
+                if (
+                    options.package is not None
+                    and sourcename not in options.package
+                ):
+                    continue
                 try:
-                    check_source(distro, source_entry)
+                    sources = get_pool_sources(distro, sourcename)
                 except OSError:
-                    # Already logged above.
-                    pass
-                except Mismatch as e:
-                    logging.warning("%s %s: %s" % (distro, sourcename, e))
+                    continue
+                for source_entry in sources:
+                    try:
+                        check_source(distro, source_entry, executor)
+                    except OSError:
+                        # Already logged above.
+                        pass
+                    except Mismatch as e:
+                        logging.warning("%s %s: %s" % (distro, sourcename, e))
 
 
 if __name__ == "__main__":
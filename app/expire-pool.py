@@ -16,11 +16,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import glob
 import logging
-import os.path
+import os
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
+from deb.version import Version
 from momlib import (
     DISTROS,
     OUR_DIST,
@@ -38,6 +40,9 @@ from momlib import (
 )
 from util import tree
 
+# Default number of packages to expire at once
+MAX_WORKERS = 16
+
 
 def options(parser):
     parser.add_option(
@@ -48,6 +53,14 @@ def options(parser):
         action="append",
         help="Process only these packages",
     )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        type="int",
+        metavar="JOBS",
+        default=MAX_WORKERS,
+        help="Number of packages to expire in parallel",
+    )
 
 
 def main(options, args):
@@ -57,24 +70,38 @@ def main(options, args):
         distros = get_pool_distros()
 
     # Run through our default distribution and use that for the base
-    # package names.  Expire from all distributions.
+    # package names.  Expire from all distributions.  Expiry is mostly
+    # waiting on the filesystem and each package has its own pool
+    # directory, so expire several of them at once.
     our_sources = set()
-    for component in DISTROS[OUR_DISTRO]["components"]:
-        for source in get_sources(OUR_DISTRO, OUR_DIST, component):
-            our_sources.add(source["Package"])
-            if (
-                options.package is not None
-                and source["Package"] not in options.package
-            ):
-                continue
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        futures = []
+        for component in DISTROS[OUR_DISTRO]["components"]:
+            for source in get_sources(OUR_DISTRO, OUR_DIST, component):
+                our_sources.add(source["Package"])
+                if (
+                    options.package is not None
+                    and source["Package"] not in options.package
+                ):
+                    continue
+
+                base = get_base(source)
+                logging.debug("%s %s", source["Package"], source["Version"])
+                logging.debug("base is %s", base)
 
-            base = get_base(source)
-            logging.debug("%s %s", source["Package"], source["Version"])
-            logging.debug("base is %s", base)
+                for distro in distros:
+                    if DISTROS[distro]["expire"]:
+                        futures.append(
+                            executor.submit(
+                                expire_pool_sources,
+                                distro,
+                                source["Package"],
+                                base,
+                            )
+                        )
 
-            for distro in distros:
-                if DISTROS[distro]["expire"]:
-                    expire_pool_sources(distro, source["Package"], base)
+        for future in futures:
+            future.result()
 
     for distro in distros:
         if not DISTROS[distro]["expire"]:
@@ -91,7 +118,7 @@ def main(options, args):
         # expiry, but just remove any files that aren't in the
         # distribution's Sources file.
         if distro != OUR_DISTRO:
-            for package in sorted(distro_sources):
+            for package, sources in sorted(distro_sources.items()):
                 if package in our_sources:
                     continue
                 if (
@@ -100,9 +127,7 @@ def main(options, args):
                 ):
                     continue
 
-                distro_versions = set(
-                    source["Version"] for source in distro_sources[package]
-                )
+                distro_versions = set(source["Version"] for source in sources)
 
                 try:
                     pool_sources = get_pool_sources(distro, package)
@@ -115,27 +140,52 @@ def main(options, args):
                         if source["Version"] not in distro_versions
                     ]
                     version_sort(remove_sources)
-                    expire_sources(
-                        distro,
-                        package,
-                        distro_sources[package],
-                        remove_sources,
-                    )
+                    expire_sources(distro, package, sources, remove_sources)
 
         # Any pool directories whose sources are in neither the default
         # distribution nor their own distribution are entirely obsolete, so
         # remove them.
-        for pooldir in glob.iglob("%s/pool/%s/*/*" % (ROOT, distro)):
-            name = os.path.basename(pooldir)
+        for entry in pool_entries(distro):
+            name = entry.name
             if options.package is not None and name not in options.package:
                 continue
             if (
                 name not in our_sources
                 and name not in distro_sources
-                and os.path.isdir(pooldir)
+                and entry.is_dir()
             ):
-                tree.remove(pooldir)
-                logging.debug("Removed %s", pooldir)
+                tree.remove(entry.path)
+                logging.debug("Removed %s", entry.path)
+
+
+def pool_entries(distro):
+    """Return the directory entries of a distro's pool, pool/DISTRO/*/*.
+
+    Hidden entries are skipped, as glob would.
+    """
+    try:
+        with os.scandir("%s/pool/%s" % (ROOT, distro)) as entries:
+            hashdirs = [
+                entry.path
+                for entry in entries
+                if not entry.name.startswith(".") and entry.is_dir()
+            ]
+    except OSError:
+        return
+
+    for hashdir in hashdirs:
+        # List each directory before handing out its entries, they may be
+        # removed as we go.
+        try:
+            with os.scandir(hashdir) as entries:
+                listing = [
+                    entry
+                    for entry in entries
+                    if not entry.name.startswith(".")
+                ]
+        except OSError:
+            continue
+        yield from listing
 
 
 def expire_pool_sources(distro, package, base):
@@ -154,10 +204,11 @@ def expire_pool_sources(distro, package, base):
     base_found = False
     keep = []
     for source in sources:
-        if base > source["Version"]:
-            bases.append(source)
+        version = Version(source["Version"])
+        if base > version:
+            bases.append((version, source))
         else:
-            if base == source["Version"]:
+            if base == version:
                 base_found = True
                 logging.info(
                     "Leaving %s %s %s (is base)",
@@ -177,8 +228,9 @@ def expire_pool_sources(distro, package, base):
 
     # If the base wasn't found, we want the newest source below that
     if not base_found and len(bases):
-        version_sort(bases)
-        source = bases.pop()
+        newest = max(bases, key=itemgetter(0))
+        bases.remove(newest)
+        source = newest[1]
         logging.info(
             "Leaving %s %s %s (is newest before base)",
             distro,
@@ -188,10 +240,14 @@ def expire_pool_sources(distro, package, base):
 
         keep.append(source)
 
-    expire_sources(distro, package, keep, bases)
+    expire_sources(distro, package, keep, [source for _, source in bases])
 
 
 def expire_sources(distro, package, keep_sources, remove_sources):
+    # Most packages have nothing to expire
+    if not remove_sources:
+        return
+
     pooldir = pool_directory(distro, package)
 
     # Identify filenames we don't want to delete
@@ -202,22 +258,46 @@ def expire_sources(distro, package, keep_sources, remove_sources):
 
     # Expire the older packages
     need_update = False
-    for source in remove_sources:
-        logging.info("Expiring %s %s %s", distro, package, source["Version"])
-
-        for _, name in files(source):
-            if name in keep_files:
-                logging.debug("Not removing %s/%s", pooldir, name)
-                continue
+    dir_fd = None
+    try:
+        for source in remove_sources:
+            logging.info(
+                "Expiring %s %s %s", distro, package, source["Version"]
+            )
+
+            for _, name in files(source):
+                if name in keep_files:
+                    logging.debug("Not removing %s/%s", pooldir, name)
+                    continue
 
-            tree.remove("%s/%s/%s" % (ROOT, pooldir, name))
-            logging.debug("Removed %s/%s", pooldir, name)
-            need_update = True
+                # Only open the pool directory once there's something to
+                # remove from it
+                if dir_fd is None:
+                    dir_fd = os.open(
+                        "%s/%s" % (ROOT, pooldir),
+                        os.O_RDONLY | os.O_DIRECTORY,
+                    )
+                remove_pool_file(dir_fd, pooldir, name)
+                logging.debug("Removed %s/%s", pooldir, name)
+                need_update = True
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
 
     if need_update:
         update_pool_sources(distro, package)
 
 
+def remove_pool_file(dir_fd, pooldir, name):
+    """Remove a file from the pool directory open as dir_fd."""
+    try:
+        os.unlink(name, dir_fd=dir_fd)
+    except FileNotFoundError:
+        pass
+    except IsADirectoryError:
+        tree.remove("%s/%s/%s" % (ROOT, pooldir, name))
+
+
 if __name__ == "__main__":
     run(
         main,
@@ -18,19 +18,19 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import bz2
+import contextlib
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timezone
+import functools
+import io
 import json
 import logging
-import os
 import re
-import subprocess
-import textwrap
 import time
 from email.utils import parseaddr
+from operator import itemgetter
 
-from deb.controlfile import ControlFile
 from deb.version import Version
 from momlib import (
     DISTROS,
@@ -39,9 +39,11 @@ from momlib import (
     ROOT,
     SRC_DIST,
     SRC_DISTRO,
+    cached_signers,
     changes_file,
-    files,
+    dsc_file,
     get_base,
+    get_charm_revision,
     get_date_superseded,
     get_importance,
     get_nearest_source,
@@ -51,10 +53,16 @@ from momlib import (
     get_same_source,
     get_sources,
     pathhash,
+    prefetch_person_lp_pages,
     proposed_package_version,
     read_blocklist,
+    read_changed_by,
+    read_person_lp_pages,
+    read_uploader_cache,
     remove_old_comments,
     run,
+    write_person_lp_pages,
+    write_uploader_cache,
 )
 from util import tree
 
@@ -71,6 +79,72 @@ COLOURS = [
 # Sections
 SECTIONS = ["new", "updated"]
 
+# Characters to escape in names shown on the status page
+HTML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+# Separator between the binary package names of a source
+BINARY_SEPARATOR = re.compile(r", *")
+
+# Row of the manual merges table.
+# The comment cells are filled in by mod_python's PSP handler when the page
+# is served, so that new comments show up straight away.
+ROW_TEMPLATE = """
+<tr bgcolor={colour} class=first>
+    <td>
+        <tt><a href="https://patches.ubuntu.com/{path_hash}/{package}/{package}_{left_version}.patch">{package}</a></tt>
+        <sup><a href="https://launchpad.net/ubuntu/+source/{package}">LP</a></sup>
+        <sup><a href="https://tracker.debian.org/{package}">PTS</a></sup>
+        {teams}</td>
+    <td colspan=2>{who}</td>
+    <td rowspan=2>
+        <form method="get" action="addcomment.psp"><br />
+            <input type="hidden" name="component" value="{component}-manual" />
+            <input type="hidden" name="package" value="{package}" />
+<% req.write(comment_field(comment, "{package}", "{colour}")) %>
+        </form></td>
+    <td rowspan=2>
+<% req.write(comment_buglink(comment, "{package}")) %>
+    </td>
+    <td rowspan=2>
+    {age}
+    </td>
+</tr>
+<tr bgcolor="{colour}">
+    <td><small{binaries_class}>{binaries}</small></td>
+    <td>{left_version}{proposed}</td>
+    <td>{right_version}</td>
+</tr>
+"""
+
+# Head of the manual status page, up to the navigation links
+PAGE_HEADER = """<!DOCTYPE html>
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<title>Ubuntu Merge-o-Matic: {component} manual</title>
+<link href="https://fonts.googleapis.com/css?family=Ubuntu:300,400,500,700" rel="stylesheet">
+<link href="./.static/css/manual-status.css" rel="stylesheet">
+<%
+import html
+from momlib import *
+%>
+</head>
+<body>
+<div class="container">
+    <img src="./.static/img/ubuntulogo-100.png" id="ubuntu" alt="Ubuntu Logo">
+    <h1>Merge-o-Matic: {component} (Manual)</h1>
+
+    <div id="navigation">
+"""
+
+EXCUSES_URL = (
+    "https://ubuntu-archive-team.ubuntu.com/"
+    "proposed-migration/update_excuses.html"
+)
+
+# Default number of packages to process at once
+MAX_WORKERS = 16
+
 
 def options(parser):
     parser.add_option(
@@ -115,10 +189,18 @@ def options(parser):
         action="append",
         help="Process only these destination components",
     )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        type="int",
+        metavar="JOBS",
+        default=MAX_WORKERS,
+        help="Number of packages to process in parallel",
+    )
 
 
 def main(options, args):
-    now = datetime.datetime.now(timezone.utc)
+    now_ts = time.time()
 
     src_distro = options.source_distro
     src_dist = options.source_suite
@@ -127,249 +209,274 @@ def main(options, args):
     our_dist = options.dest_suite
 
     blocklist = read_blocklist()
+    uploader_cache = read_uploader_cache()
+    read_person_lp_pages()
+
+    process_source = functools.partial(
+        _process_source,
+        blocklist=blocklist,
+        now_ts=now_ts,
+        our_distro=our_distro,
+        our_dist=our_dist,
+        src_distro=src_distro,
+        src_dist=src_dist,
+        debug=logging.getLogger().isEnabledFor(logging.DEBUG),
+    )
 
     # For each package in the destination distribution, find out whether
     # there's an open merge, and if so add an entry to the table for it.
-    for our_component in DISTROS[our_distro]["components"]:
-        if (
-            options.component is not None
-            and our_component not in options.component
-        ):
-            continue
-
-        merges = []
-
-        for our_source in get_sources(our_distro, our_dist, our_component):
-            if our_source["Package"] in blocklist:
-                continue
-            try:
-                package = our_source["Package"]
-                our_version = Version(our_source["Version"])
-                our_pool_source = get_pool_source(
-                    our_distro,
-                    package,
-                    our_version,
-                )
-                logging.debug("%s: %s is %s", package, our_distro, our_version)
-            except (OSError, IndexError):
+    # Packages are independent and most of the time is spent waiting on
+    # disk, gpg and Launchpad, so look at several of them at once.
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        for our_component in DISTROS[our_distro]["components"]:
+            if (
+                options.component is not None
+                and our_component not in options.component
+            ):
                 continue
 
-            try:
-                (src_source, src_version, src_pool_source) = get_same_source(
-                    src_distro,
-                    src_dist,
-                    package,
-                )
-                logging.debug("%s: %s is %s", package, src_distro, src_version)
-            except IndexError:
-                continue
-
-            base_version = None
-            try:
-                base = get_base(our_pool_source)
-                base_source = get_nearest_source(package, base)
-                base_version = Version(base_source["Version"])
-                logging.debug(
-                    "%s: base is %s (%s wanted)",
+            sources = get_sources(our_distro, our_dist, our_component)
+            pending = [
+                merge
+                for merge in executor.map(process_source, sources)
+                if merge is not None
+            ]
+
+            # Check the signatures of all the dsc files at once, starting gpg
+            # for each of them takes longer than the check itself.
+            dsc_files = {
+                merge[2]: dsc_file(our_distro, merge[4]) for merge in pending
+            }
+            uploaders = cached_signers(
+                [
+                    filename
+                    for filename in dsc_files.values()
+                    if filename is not None
+                ],
+                uploader_cache,
+            )
+            merges = [
+                (
+                    section,
+                    days_old,
                     package,
-                    base_version,
-                    base,
+                    user,
+                    uploaders.get(dsc_files[package]),
+                    source,
+                    our_version,
+                    src_version,
+                    teams,
                 )
-                continue
-            except IndexError:
-                pass
-
-            teams = get_responsible_team(package)
-            date_superseded = get_date_superseded(package, base_version)
-            if not date_superseded:
-                age = datetime.timedelta(0)
-            else:
-                ds_aware = date_superseded.replace(tzinfo=timezone.utc)
-                age = now - ds_aware
-
-            days_old = age.days
-
-            filename = changes_file(our_distro, our_source)
-            if os.path.isfile(filename):
-                changes = open(filename)
-            elif os.path.isfile(filename + ".bz2"):
-                changes = bz2.BZ2File(filename + ".bz2")
-            else:
-                changes = None
-
-            if changes is not None:
-                info = ControlFile(
-                    fileobj=changes,
-                    multi_para=False,
-                    signed=False,
-                ).para
-
-                user = info.get("Changed-By") if info else None
-                # not enough to determine if it is updated LP: #1474139
-                # uploaded = info["Distribution"] == OUR_DIST
-                uploaded = False
-            else:
-                user = None
-                uploaded = False
-
-            uploader = get_uploader(our_distro, our_source)
-
-            if uploaded:
-                section = "updated"
-            else:
-                section = "new"
-
-            merges.append(
-                (
+                for (
                     section,
                     days_old,
                     package,
                     user,
-                    uploader,
-                    our_source,
+                    source,
                     our_version,
                     src_version,
                     teams,
-                ),
+                ) in pending
+            ]
+
+            write_status(our_component, merges, our_distro, src_distro)
+
+    write_uploader_cache(uploader_cache)
+    write_person_lp_pages()
+
+
+def _process_source(
+    our_source,
+    blocklist,
+    now_ts,
+    our_distro,
+    our_dist,
+    src_distro,
+    src_dist,
+    debug=False,
+):
+    """Return the manual merge entry for a source, or None if there's none.
+
+    The uploader isn't known yet, it is found for all the merges at once.
+    debug tells whether debug messages are logged at all, so they can be
+    skipped cheaply otherwise.
+    """
+    if our_source["Package"] in blocklist:
+        return None
+    try:
+        package = our_source["Package"]
+        our_version = Version(our_source["Version"])
+        our_pool_source = get_pool_source(
+            our_distro,
+            package,
+            our_version,
+        )
+        if debug:
+            logging.debug("%s: %s is %s", package, our_distro, our_version)
+    except (OSError, IndexError):
+        return None
+
+    try:
+        (src_source, src_version, src_pool_source) = get_same_source(
+            src_distro,
+            src_dist,
+            package,
+        )
+        if debug:
+            logging.debug("%s: %s is %s", package, src_distro, src_version)
+    except IndexError:
+        return None
+
+    base_version = None
+    try:
+        base = get_base(our_pool_source)
+        base_source = get_nearest_source(package, base)
+        base_version = Version(base_source["Version"])
+        if debug:
+            logging.debug(
+                "%s: base is %s (%s wanted)",
+                package,
+                base_version,
+                base,
             )
+        return None
+    except IndexError:
+        pass
 
-        write_status_page(our_component, merges, our_distro, src_distro)
-        write_status_json(our_component, merges, our_distro, src_distro)
+    teams = get_responsible_team(package)
+    date_superseded = get_date_superseded(package, base_version)
+    if not date_superseded:
+        days_old = 0
+    else:
+        if date_superseded.tzinfo is None:
+            date_superseded = date_superseded.replace(tzinfo=timezone.utc)
+        days_old = int((now_ts - date_superseded.timestamp()) // 86400)
 
-        status_file = "%s/merges/tomerge-%s-manual" % (ROOT, our_component)
-        remove_old_comments(status_file, merges)
-        write_status_file(status_file, merges)
+    user = read_changed_by(changes_file(our_distro, our_source))
+    # not enough to determine if it is updated LP: #1474139
+    # uploaded = info["Distribution"] == OUR_DIST
+    uploaded = False
 
+    if uploaded:
+        section = "updated"
+    else:
+        section = "new"
 
-def write_status_page(component, merges, left_distro, right_distro):
-    """Write out the manual merge status page."""
-    merges.sort(reverse=True)
-    status_file = "%s/merges/%s-manual.html" % (ROOT, component)
+    return (
+        section,
+        days_old,
+        package,
+        user,
+        our_source,
+        our_version,
+        src_version,
+        teams,
+    )
 
-    try:
-        from pathlib import Path
-        agent_dir = Path("/var/lib/juju/agents/")
-        charm_dir = next(agent_dir.glob("unit-ubuntu-merges-*")) / "charm"
-        revision = (charm_dir / "version").read_text().strip()
-    except (StopIteration, FileNotFoundError, PermissionError):
-        revision = "unknown"
+
+def write_status(component, merges, left_distro, right_distro):
+    """Write out the manual merge status page, JSON dump and status file.
+
+    All three are produced in a single pass over the merges.
+    """
+    # Split the merges by section before sorting them, so that only their
+    # age and name need comparing, the rest may be costly to compare.
+    by_section = {section: [] for section in SECTIONS}
+    for merge in merges:
+        by_section[merge[0]].append(merge)
+    for section_merges in by_section.values():
+        section_merges.sort(key=itemgetter(1, 2), reverse=True)
+    merges = [merge for section in SECTIONS for merge in by_section[section]]
+    counts = {section: len(by_section[section]) for section in SECTIONS}
+
+    page_file = "%s/merges/%s-manual.html" % (ROOT, component)
+    json_file = "%s/merges/%s-manual.json" % (ROOT, component)
+    status_file = "%s/merges/tomerge-%s-manual" % (ROOT, component)
+
+    # Needs the previous status file, so do this before replacing it
+    remove_old_comments(status_file, merges)
+
+    # The page has the number of merges in each section ahead of the
+    # tables, so buffer the table rows.
+    tables = {section: io.StringIO() for section in SECTIONS}
+    # The component is the same on every row, fill it in once
+    row_template = ROW_TEMPLATE.replace("{component}", component)
+    data = []
+
+    # Find everybody's Launchpad page up front, a few at a time, rather
+    # than waiting on Launchpad for each row in turn.
+    people = [parse_people(merge[3], merge[4]) for merge in merges]
+    prefetch_person_lp_pages(
+        {usr_mail for (usr_mail, _, _) in people if usr_mail is not None}
+        | {upl_mail for (_, upl_mail, show) in people if show},
+    )
+
+    with contextlib.ExitStack() as stack:
+        page = stack.enter_context(tree.AtomicFile(page_file, "wt"))
+        json_status = stack.enter_context(tree.AtomicFile(json_file, "wt"))
+        status = stack.enter_context(tree.AtomicFile(status_file, "wt"))
+
+        for merge, merge_people in zip(merges, people):
+            section = merge[0]
+            path_hash = pathhash(merge[2])
+            binaries = BINARY_SEPARATOR.split(
+                merge[5]["Binary"].replace("\n", ""),
+            )
+            tables[section].write(
+                table_row(
+                    merge,
+                    path_hash,
+                    binaries,
+                    merge_people,
+                    left_distro,
+                    row_template,
+                ),
+            )
+            data.append(json_entry(merge, path_hash, binaries, merge_people))
+            print(status_line(merge), file=status)
+
+        write_status_page(
+            page,
+            component,
+            tables,
+            counts,
+            left_distro,
+            right_distro,
+        )
+        # Only the C encoder is fast, and it is only used for compact output
+        # encoded in one go
+        json_status.write(json.dumps(data, separators=(",", ":"), default=str))
+
+
+def write_status_page(
+    status,
+    component,
+    tables,
+    counts,
+    left_distro,
+    right_distro,
+):
+    """Write out the manual merge status page."""
+    revision = get_charm_revision()
 
     now_str = datetime.datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-    with tree.AtomicFile(status_file, "wt") as status:
+    status.write(PAGE_HEADER.format(component=component))
+
+    for section in SECTIONS:
         print(
-            f"""<!DOCTYPE html>
-<html>
-<head>
-<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
-<title>Ubuntu Merge-o-Matic: {component} manual</title>
-<link href="https://fonts.googleapis.com/css?family=Ubuntu:300,400,500,700" rel="stylesheet">
-<style>
-    :root {{
-        --ubuntu-orange: #e95420;
-        --ubuntu-aubergine: #772953;
-        --text-color: #1a1a1a;
-        --bg-page: #f3f4f6;
-    }}
-    body {{
-        font-family: "Ubuntu", sans-serif;
-        background-color: var(--bg-page);
-        color: var(--text-color);
-        margin: 0;
-        padding: 20px;
-        line-height: 1.5;
-    }}
-    h1 {{
-        color: var(--ubuntu-aubergine);
-        border-bottom: 4px solid var(--ubuntu-orange);
-        padding-bottom: 10px;
-        margin-bottom: 30px;
-    }}
-    table {{
-        width: 100%;
-        border-collapse: separate;
-        border-spacing: 0;
-        background: white;
-        border: 2px solid #9ca3af;
-        box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.1);
-        border-radius: 8px;
-        overflow: hidden;
-    }}
-    th {{
-        background-color: #4b5563;
-        color: white;
-        text-align: left;
-        padding: 15px;
-        text-transform: uppercase;
-        font-size: 0.85em;
-        letter-spacing: 0.05em;
-    }}
-    td {{
-        padding: 12px 15px;
-        border-bottom: 1px solid rgba(0,0,0,0.1);
-        vertical-align: top;
-    }}
-    tr.first td {{
-        border-top: 2px solid #6b7280;
-    }}
-    input[type="text"] {{
-        border: 1px solid #9ca3af !important;
-        background-color: white !important;
-        padding: 6px;
-        border-radius: 3px;
-        color: #000;
-        width: 95%;
-    }}
-    a {{
-        color: #c2410c;
-        text-decoration: none;
-        font-weight: bold;
-    }}
-    a:hover {{
-        text-decoration: underline;
-    }}
-    .expanded {{
-        display: none;
-    }}
-    footer {{
-        margin-top: 50px;
-        padding: 20px 0;
-        border-top: 1px solid #ccc;
-        font-size: 0.85rem;
-        color: #333;
-    }}
-</style>
-<%
-import html
-from momlib import *
-%>
-</head>
-<body>
-<div class="container">
-    <img src="./.static/img/ubuntulogo-100.png" id="ubuntu" alt="Ubuntu Logo">
-    <h1>Merge-o-Matic: {component} (Manual)</h1>
-    
-    <div id="navigation">
-              """,
+            f'<a href="#{section}" style="margin-right: 15px;">&rarr; {counts[section]} {section} merges</a>',
             file=status,
         )
 
-        for section in SECTIONS:
-            section_merges = [m for m in merges if m[0] == section]
-            print(
-                f'<a href="#{section}" style="margin-right: 15px;">&rarr; {len(section_merges)} {section} merges</a>',
-                file=status,
-            )
-
-        print("<% comment = get_comments() %>", file=status)
+    print("<% comment = get_comments() %>", file=status)
 
-        for section in SECTIONS:
-            section_merges = [m for m in merges if m[0] == section]
-            print(f'<h2 id="{section}">{section.title()} Merges</h2>', file=status)
-            do_table(status, section_merges, left_distro, right_distro, component)
+    for section in SECTIONS:
+        print(f'<h2 id="{section}">{section.title()} Merges</h2>', file=status)
+        do_table(status, tables[section], left_distro, right_distro)
 
-        print(
-            f"""
+    print(
+        f"""
     <footer>
         Generated at {now_str} by 
         <strong>merge-o-matic</strong> (revision {revision}).
@@ -378,44 +485,11 @@ from momlib import *
 </body>
 </html>
               """,
-            file=status,
-        )
-
-
-def get_uploader(distro, source):
-    """Obtain the uploader from the dsc file signature."""
-    for _, name in files(source):
-        if name.endswith(".dsc"):
-            dsc_file = name
-            break
-    else:
-        return None
-
-    filename = "%s/pool/%s/%s/%s/%s" % (
-        ROOT,
-        distro,
-        pathhash(source["Package"]),
-        source["Package"],
-        dsc_file,
+        file=status,
     )
 
-    with open(os.devnull, "w") as devnull:
-        gpg = subprocess.Popen(
-            ["gpg", "--verify", filename],
-            stdout=devnull,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
-    stderr = gpg.communicate()[1]
-    if gpg.returncode != 0:
-        return None
-    for line in stderr.splitlines():
-        if "Good signature from" in line:
-            return line.split("Good signature from")[1].strip().strip('"')
-    return None
-
 
-def do_table(status, merges, left_distro, right_distro, component):
+def do_table(status, rows, left_distro, right_distro):
     """Output a table."""
     print(
         f"""
@@ -435,8 +509,33 @@ def do_table(status, merges, left_distro, right_distro, component):
           """,
         file=status,
     )
+    status.write(rows.getvalue())
+    print("</table>", file=status)
+
+
+def parse_people(user, uploader):
+    """Return the addresses of the changer and uploader of a merge.
+
+    Also tells whether the uploader should be shown at all, which is only
+    when they aren't the person who made the change.
+    """
+    usr_mail = None
+    upl_mail = None
+    show_uploader = False
+    if user is not None:
+        (usr_name, usr_mail) = parseaddr(user)
+        if uploader is not None:
+            (upl_name, upl_mail) = parseaddr(uploader)
+            show_uploader = bool(usr_name) and usr_name != upl_name
+    return (usr_mail, upl_mail, show_uploader)
+
 
-    for (
+def table_row(merge, path_hash, binaries, people, left_distro, row_template):
+    """Return the status page table row for a merge.
+
+    row_template is ROW_TEMPLATE with the component already filled in.
+    """
+    (
         uploaded,
         age,
         package,
@@ -446,174 +545,78 @@ def do_table(status, merges, left_distro, right_distro, component):
         left_version,
         right_version,
         teams,
-    ) in merges:
-        colour_idx = get_importance(age)
-        if user is not None:
-            (usr_name, usr_mail) = parseaddr(user)
-            user_lp_page = get_person_lp_page(usr_mail)
-            user = user.replace("&", "&amp;")
-            user = user.replace("<", "&lt;")
-            user = user.replace(">", "&gt;")
-            if user_lp_page:
-                who = "<a href='%s'>%s</a>" % (user_lp_page, user)
-            else:
-                who = user
-
-            if uploader is not None:
-                (upl_name, upl_mail) = parseaddr(uploader)
-                upl_lp_page = get_person_lp_page(upl_mail)
-
-                if usr_name and usr_name != upl_name:
-                    u_who = uploader
-                    u_who = u_who.replace("&", "&amp;")
-                    u_who = u_who.replace("<", "&lt;")
-                    u_who = u_who.replace(">", "&gt;")
-                    if upl_lp_page:
-                        who = (
-                            "%s<br><small><em>Uploader:</em> "
-                            "<a href='%s'>%s</a></small>"
-                            % (who, upl_lp_page, u_who)
-                        )
-                    else:
-                        who = "%s<br><small><em>Uploader:</em> %s</small>" % (
-                            who,
-                            u_who,
-                        )
+    ) = merge
+    (usr_mail, upl_mail, show_uploader) = people
+    colour_idx = get_importance(age)
+    if user is not None:
+        user_lp_page = get_person_lp_page(usr_mail)
+        user = user.translate(HTML_ESCAPES)
+        if user_lp_page:
+            who = "<a href='%s'>%s</a>" % (user_lp_page, user)
         else:
-            who = "&nbsp;"
+            who = user
 
-        if left_distro == "ubuntu":
-            proposed_version = proposed_package_version(package, left_version)
-        else:
-            proposed_version = None
-        if proposed_version:
-            # If there is a proposed verison we want to set the bg colour to
-            # grey and display the version number.
-            colour_idx = 6
+        if show_uploader:
+            upl_lp_page = get_person_lp_page(upl_mail)
+            u_who = uploader.translate(HTML_ESCAPES)
+            if upl_lp_page:
+                who = (
+                    "%s<br><small><em>Uploader:</em> "
+                    "<a href='%s'>%s</a></small>" % (who, upl_lp_page, u_who)
+                )
+            else:
+                who = "%s<br><small><em>Uploader:</em> %s</small>" % (
+                    who,
+                    u_who,
+                )
+    else:
+        who = "&nbsp;"
 
-        print(
-            f"""
-        <tr bgcolor={COLOURS[colour_idx]} class=first>
-            <td>
-                <tt><a href="https://patches.ubuntu.com/{pathhash(package)}/{package}/{package}_{left_version}.patch">{package}</a></tt>
-                <sup><a href="https://launchpad.net/ubuntu/+source/{package}">LP</a></sup>
-                <sup><a href="https://tracker.debian.org/{package}">PTS</a></sup>
-              """,
-            file=status,
+    if left_distro == "ubuntu":
+        proposed_version = proposed_package_version(package, left_version)
+    else:
+        proposed_version = None
+    if proposed_version:
+        # If there is a proposed verison we want to set the bg colour to
+        # grey and display the version number.
+        colour_idx = 6
+        proposed = ' (<a href="%s#%s">%s</a>)' % (
+            EXCUSES_URL,
+            package,
+            proposed_version,
         )
-        cell_data = ""
-        if teams:
-            cell_data += "["
-            cell_data += "%s" % ", ".join(t for t in teams)
-            cell_data += "]</td>"
-        else:
-            cell_data = "</td>"
-        print(cell_data, file=status)
+    else:
+        proposed = ""
 
-        print(
-            f"""
-              <td colspan=2>{who}</td>
-              <td rowspan=2>
-                  <form method="get" action="addcomment.psp"><br />
-                      <input type="hidden" name="component" value="{component}-manual" />
-                      <input type="hidden" name="package" value="{package}" />
-              """,
-            file=status,
-        )
-        print(
-            # The `start block` and `end block` are used to prevent mod_python's
-            # PSP handler from getting confused with the indentation.
-            # See https://modpython.org/live/current/doc-html/pythonapi.html#pyapi-psp
-            # for some details.
-            textwrap.dedent(
-                f"""\
-                <%
-                # start block
-                the_comment = ""
-                the_color = "white"
-                if "{package}" in comment:
-                    the_comment = comment["{package}"]
-                    the_color = "{COLOURS[colour_idx]}"
-                req.write(
-                    "<input type=\\"text\\" "
-                    "style=\\"border-style: none; background-color: %s\\" "
-                    "name=\\"comment\\" value=\\"%s\\" title=\\"%s\\" />" %
-                    (the_color, html.escape(the_comment, quote=True),
-                     html.escape(the_comment))
-                )
-                # end block
-                %>
-                """
-            ),
-            file=status,
-        )
-        print(
-            """
-            </form></td>
-            <td rowspan=2>
-            """,
-            file=status,
-        )
-        print(
-            textwrap.dedent(
-                f"""
-                <%
-                # start block
-                if "{package}" in comment:
-                    req.write("%s" % gen_buglink_from_comment(comment["{package}"]))
-                else:
-                    req.write("&nbsp;")
-                # end block
-                %>"""
-            ),
-            file=status,
-        )
-        print(
-            f"""
-            </td>
-            <td rowspan=2>
-            {age}
-            </td>
-            </tr>
-            <tr bgcolor="{COLOURS[colour_idx]}">
-              """,
-            file=status,
-        )
-        # If the given package list is more than 10, hide it
-        if len(source["Binary"].strip().split(", ")) > 10:
-            print(
-                f"<td><small class='expanded'>{source['Binary']}</small></td>",
-                file=status,
-            )
-        else:
-            print(f"<td><small>{source['Binary']}</small></td>", file=status)
-        if proposed_version:
-            excuses_url = (
-                "https://ubuntu-archive-team.ubuntu.com/"
-                "proposed-migration/update_excuses.html"
-            )
-            print(
-                f'<td>{left_version} (<a href="{excuses_url}#{package}">{proposed_version}</a>)</td>',
-                file=status,
-            )
-        else:
-            print(f"<td>{left_version}</td>", file=status)
-        print(
-            f"""
-              <td>{right_version}</td>
-              </tr>
-              """,
-            file=status,
-        )
+    if teams:
+        teams_cell = "[%s]" % ", ".join(t for t in teams)
+    else:
+        teams_cell = ""
 
-    print("</table>", file=status)
+    # If the given package list is more than 10, hide it
+    if len(binaries) > 10:
+        binaries_class = " class='expanded'"
+    else:
+        binaries_class = ""
+
+    return row_template.format(
+        colour=COLOURS[colour_idx],
+        package=package,
+        path_hash=path_hash,
+        teams=teams_cell,
+        who=who,
+        age=age,
+        binaries_class=binaries_class,
+        binaries=source["Binary"],
+        left_version=left_version,
+        proposed=proposed,
+        right_version=right_version,
+    )
 
 
-def write_status_json(component, merges, left_distro, right_distro):
-    """Write out the merge status JSON dump."""
-    status_file = "%s/merges/%s-manual.json" % (ROOT, component)
-    data = []
-    for (
+def json_entry(merge, path_hash, binaries, people):
+    """Return the JSON dump entry for a merge."""
+    (
         uploaded,
         age,
         package,
@@ -623,69 +626,47 @@ def write_status_json(component, merges, left_distro, right_distro):
         left_version,
         right_version,
         teams,
-    ) in merges:
-        who = None
-        u_who = None
-        if user is not None:
-            who = user
-            who = who.replace("\\", "\\\\")
-            who = who.replace('"', '\\"')
-            if uploader is not None:
-                (usr_name, usr_mail) = parseaddr(user)
-                (upl_name, upl_mail) = parseaddr(uploader)
-                if usr_name and usr_name != upl_name:
-                    u_who = uploader
-                    u_who = u_who.replace("\\", "\\\\")
-                    u_who = u_who.replace('"', '\\"')
-        binaries = re.split(", *", source["Binary"].replace("\n", ""))
-        # source_package, short_description, and link are for
-        # Harvest (http://daniel.holba.ch/blog/?p=838).
-        data.append(
-            {
-                "source_package": package,
-                "short_description": "merge %s" % right_version,
-                "link": "https://merges.ubuntu.com/%s/%s/"
-                % (pathhash(package), package),
-                "uploaded": uploaded,
-                "age": age,
-                "user": who,
-                "uploader": u_who,
-                "binaries": binaries,
-                "left_version": "%s" % left_version,
-                "right_version": "%s" % right_version,
-            },
-        )
-    with tree.AtomicFile(status_file, "wt") as status:
-        status.write(json.dumps(data, indent=4))
-
-
-def write_status_file(status_file, merges):
-    """Write out the merge status file."""
-    with tree.AtomicFile(status_file, "wt") as status:
-        for (
-            uploaded,
-            age,
-            package,
-            user,
-            uploader,
-            source,
-            left_version,
-            right_version,
-            teams,
-        ) in merges:
-            print(
-                "%s %s %s %s, %s, %s, %s"
-                % (
-                    package,
-                    age,
-                    left_version,
-                    right_version,
-                    user,
-                    uploader,
-                    uploaded,
-                ),
-                file=status,
-            )
+    ) = merge
+    (usr_mail, upl_mail, show_uploader) = people
+    u_who = uploader if show_uploader else None
+    # source_package, short_description, and link are for
+    # Harvest (http://daniel.holba.ch/blog/?p=838).
+    return {
+        "source_package": package,
+        "short_description": "merge %s" % right_version,
+        "link": "https://merges.ubuntu.com/%s/%s/" % (path_hash, package),
+        "uploaded": uploaded,
+        "age": age,
+        "user": user,
+        "uploader": u_who,
+        "binaries": binaries,
+        "left_version": left_version,
+        "right_version": right_version,
+    }
+
+
+def status_line(merge):
+    """Return the status file line for a merge."""
+    (
+        uploaded,
+        age,
+        package,
+        user,
+        uploader,
+        source,
+        left_version,
+        right_version,
+        teams,
+    ) = merge
+    return "%s %s %s %s, %s, %s, %s" % (
+        package,
+        age,
+        left_version,
+        right_version,
+        user,
+        uploader,
+        uploaded,
+    )
 
 
 if __name__ == "__main__":
@@ -18,18 +18,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import bz2
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timezone
+import functools
 import json
-import os
 import re
-import subprocess
 import textwrap
 import time
 from email.utils import parseaddr
+from operator import itemgetter
 
-from deb.controlfile import ControlFile
 from momlib import (
     DISTROS,
     OUR_DIST,
@@ -37,20 +36,28 @@ from momlib import (
     ROOT,
     SRC_DIST,
     SRC_DISTRO,
+    cached_signers,
     changes_file,
-    files,
+    dsc_file,
+    get_charm_revision,
     get_date_superseded,
     get_importance,
     get_person_lp_page,
     get_responsible_team,
     get_sources,
     pathhash,
+    prefetch_person_lp_pages,
     proposed_package_version,
     read_blocklist,
+    read_changed_by,
+    read_person_lp_pages,
     read_report,
+    read_uploader_cache,
     remove_old_comments,
     result_dir,
     run,
+    write_person_lp_pages,
+    write_uploader_cache,
 )
 from util import tree
 
@@ -67,6 +74,82 @@ COLOURS = [
 # Sections
 SECTIONS = ["outstanding", "new", "updated"]
 
+# Default number of packages to process at once
+MAX_WORKERS = 16
+
+# Characters to escape in names shown on the status page
+HTML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+# Separator between the binary package names of a source
+BINARY_SEPARATOR = re.compile(r", *")
+
+# Row of the merges table.
+# The comment cells are filled in by mod_python's PSP handler when the page
+# is served, so that new comments show up straight away.
+ROW_TEMPLATE = """
+<tr bgcolor={colour} class=first>
+    <td>
+        <tt><a href="{path_hash}/{package}/REPORT">{package}</a></tt>
+        <sup><a href="https://launchpad.net/ubuntu/+source/{package}">LP</a></sup>
+        <sup><a href="https://tracker.debian.org/{package}">PTS</a></sup>
+        {teams}</td>
+    <td colspan=3>{who}</td>
+    <td rowspan=2>
+        <form method="get" action="addcomment.psp"><br />
+            <input type="hidden" name="component" value="{component}" />
+            <input type="hidden" name="package" value="{package}" />
+<% req.write(comment_field(comment, "{package}", "{colour}")) %>
+        </form></td>
+    <td rowspan=2>
+<% req.write(comment_buglink(comment, "{package}")) %>
+    </td>
+    <td rowspan=2>
+    {age}
+    </td>
+</tr>
+<tr bgcolor="{colour}">
+    <td><small{binaries_class}>{binaries}</small></td>
+    <td>{left_version}{proposed}</td>
+    <td>{right_version}</td>
+    <td>{base_version}</td>
+</tr>
+"""
+
+# Head of the status page, up to the navigation links
+PAGE_HEADER = """<!DOCTYPE html>
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<title>Ubuntu Merge-o-Matic: {component}</title>
+<link href="https://fonts.googleapis.com/css?family=Ubuntu:300,400,500,700" rel="stylesheet">
+<link href="./.static/css/merge-status.css" rel="stylesheet">
+<%
+import html
+from momlib import *
+%>
+</head>
+<body>
+<div class="container">
+    <img src="./.static/img/ubuntulogo-100.png" id="ubuntu" alt="Ubuntu Logo">
+    <h1>Merge-o-Matic: {component}</h1>
+
+    <div id="filters">
+        <div style="margin-bottom: 10px;"><strong>Filters:</strong>
+            <input id="query" name="query" style="width: 300px;"/>
+        </div>
+        <label><input id="showProposed" checked="checked" type="checkbox"> Show Proposed</label> &nbsp;
+        <label><input id="showMergeNeeded" checked="checked" type="checkbox"> Show Merge Needed</label> &nbsp;
+        <label><input id="showLongBinaries" type="checkbox"> Show full binary list</label>
+    </div>
+
+    <div id="navigation">
+"""
+
+EXCUSES_URL = (
+    "https://ubuntu-archive-team.ubuntu.com/"
+    "proposed-migration/update_excuses.html"
+)
+
 
 def options(parser):
     parser.add_option(
@@ -111,10 +194,18 @@ def options(parser):
         action="append",
         help="Process only these destination components",
     )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        type="int",
+        metavar="JOBS",
+        default=MAX_WORKERS,
+        help="Number of packages to process in parallel",
+    )
 
 
 def main(options, args):
-    now = datetime.datetime.now(timezone.utc)
+    now_ts = time.time()
 
     src_distro = options.source_distro
 
@@ -122,299 +213,205 @@ def main(options, args):
     our_dist = options.dest_suite
 
     blocklist = read_blocklist()
+    uploader_cache = read_uploader_cache()
+    read_person_lp_pages()
 
-    outstanding = []
-    if os.path.isfile("%s/outstanding-merges.txt" % ROOT):
-        after_uvf = True
-
+    sections = list(SECTIONS)
+    try:
         with open("%s/outstanding-merges.txt" % ROOT) as f:
-            for line in f:
-                outstanding.append(line.strip())
-    else:
+            outstanding = {line.strip() for line in f}
+        after_uvf = True
+    except FileNotFoundError:
+        outstanding = set()
         after_uvf = False
-        SECTIONS.remove("new")
+        sections.remove("new")
+
+    process_source = functools.partial(
+        _process_source,
+        blocklist=blocklist,
+        outstanding=outstanding,
+        after_uvf=after_uvf,
+        now_ts=now_ts,
+        our_distro=our_distro,
+        src_distro=src_distro,
+    )
 
     # For each package in the destination distribution, find out whether
     # there's an open merge, and if so add an entry to the table for it.
-    for our_component in DISTROS[our_distro]["components"]:
-        if (
-            options.component is not None
-            and our_component not in options.component
-        ):
-            continue
-
-        merges = []
-
-        for source in get_sources(our_distro, our_dist, our_component):
-            if source["Package"] in blocklist:
-                continue
-            try:
-                output_dir = result_dir(source["Package"])
-                (base_version, left_version, right_version) = read_report(
-                    output_dir,
-                    our_distro,
-                    src_distro,
-                )
-            except ValueError:
+    # Packages are independent and most of the time is spent waiting on
+    # disk and Launchpad, so look at several of them at once.
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        for our_component in DISTROS[our_distro]["components"]:
+            if (
+                options.component is not None
+                and our_component not in options.component
+            ):
                 continue
-            teams = get_responsible_team(source["Package"])
-            date_superseded = get_date_superseded(
-                source["Package"],
-                base_version,
-            )
-            if not date_superseded:
-                age = datetime.timedelta(0)
-            else:
-                ds_aware = date_superseded.replace(tzinfo=timezone.utc)
-                age = now - ds_aware
-
-            days_old = age.days
-
-            filename = changes_file(our_distro, source)
-            if os.path.isfile(filename):
-                changes = open(filename)
-            elif os.path.isfile(filename + ".bz2"):
-                changes = bz2.BZ2File(filename + ".bz2")
-            else:
-                changes = None
-
-            if changes is not None:
-                info = ControlFile(
-                    fileobj=changes,
-                    multi_para=False,
-                    signed=False,
-                ).para
-
-                user = info.get("Changed-By") if info else None
-                try:
-                    uploaded = False
-                    # not enough to determine if it is updated LP: #1474139
-                    # uploaded = info["Distribution"] == OUR_DIST
-                    # better but not sufficient
-                    # if info["Distribution"] == OUR_DIST:
-                    #     if base_version.upstream == left_version.upstream:
-                    #         uploaded = True
-                except KeyError:
-                    uploaded = False
-            else:
-                user = None
-                uploaded = False
-
-            uploader = get_uploader(our_distro, source)
 
-            if uploaded:
-                section = "updated"
-            elif not after_uvf or source["Package"] in outstanding:
-                section = "outstanding"
-            else:
-                section = "new"
-
-            merges.append(
-                (
-                    section,
-                    days_old,
-                    source["Package"],
-                    user,
-                    uploader,
-                    source,
-                    base_version,
-                    left_version,
-                    right_version,
-                    teams,
-                ),
+            sources = get_sources(our_distro, our_dist, our_component)
+            pending = [
+                merge
+                for merge in executor.map(process_source, sources)
+                if merge is not None
+            ]
+
+            # Check the signatures of all the dsc files at once, starting gpg
+            # for each of them takes longer than the check itself.
+            dsc_files = {
+                merge[2]: dsc_file(our_distro, merge[4]) for merge in pending
+            }
+            uploaders = cached_signers(
+                [
+                    filename
+                    for filename in dsc_files.values()
+                    if filename is not None
+                ],
+                uploader_cache,
             )
-        merges.sort(reverse=True)
-
-        write_status_page(our_component, merges, our_distro, src_distro)
-        write_status_json(our_component, merges, our_distro, src_distro)
-
-        status_file = "%s/merges/tomerge-%s" % (ROOT, our_component)
-        remove_old_comments(status_file, merges)
-        write_status_file(status_file, merges)
-
-
-def get_uploader(distro, source):
-    """Obtain the uploader from the dsc file signature."""
-    for _, name in files(source):
-        if name.endswith(".dsc"):
-            dsc_file = name
-            break
-    else:
+            merges = []
+            for (
+                section,
+                days_old,
+                package,
+                user,
+                source,
+                base_version,
+                left_version,
+                right_version,
+                teams,
+            ) in pending:
+                merges.append(
+                    (
+                        section,
+                        days_old,
+                        package,
+                        user,
+                        uploaders.get(dsc_files[package]),
+                        source,
+                        base_version,
+                        left_version,
+                        right_version,
+                        teams,
+                        pathhash(package),
+                    ),
+                )
+            merges.sort(key=itemgetter(0, 1, 2), reverse=True)
+
+            write_status_page(
+                our_component,
+                merges,
+                sections,
+                our_distro,
+                src_distro,
+            )
+            write_status_json(our_component, merges, our_distro, src_distro)
+
+            status_file = "%s/merges/tomerge-%s" % (ROOT, our_component)
+            remove_old_comments(status_file, merges)
+            write_status_file(status_file, merges)
+
+    write_uploader_cache(uploader_cache)
+    write_person_lp_pages()
+
+
+def _process_source(
+    source,
+    blocklist,
+    outstanding,
+    after_uvf,
+    now_ts,
+    our_distro,
+    src_distro,
+):
+    """Return the merge entry for a source, or None if there's none.
+
+    The uploader isn't known yet, it is found for all the merges at once.
+    """
+    if source["Package"] in blocklist:
         return None
+    try:
+        output_dir = result_dir(source["Package"])
+        (base_version, left_version, right_version) = read_report(
+            output_dir,
+            our_distro,
+            src_distro,
+        )
+    except ValueError:
+        return None
+    teams = get_responsible_team(source["Package"])
+    date_superseded = get_date_superseded(
+        source["Package"],
+        base_version,
+    )
+    if not date_superseded:
+        days_old = 0
+    else:
+        if date_superseded.tzinfo is None:
+            date_superseded = date_superseded.replace(tzinfo=timezone.utc)
+        days_old = int((now_ts - date_superseded.timestamp()) // 86400)
+
+    user = read_changed_by(changes_file(our_distro, source))
+    # not enough to determine if it is updated LP: #1474139
+    # uploaded = info["Distribution"] == OUR_DIST
+    # better but not sufficient
+    # if info["Distribution"] == OUR_DIST:
+    #     if base_version.upstream == left_version.upstream:
+    #         uploaded = True
+    uploaded = False
+
+    if uploaded:
+        section = "updated"
+    elif not after_uvf or source["Package"] in outstanding:
+        section = "outstanding"
+    else:
+        section = "new"
 
-    filename = "%s/pool/%s/%s/%s/%s" % (
-        ROOT,
-        distro,
-        pathhash(source["Package"]),
+    return (
+        section,
+        days_old,
         source["Package"],
-        dsc_file,
+        user,
+        source,
+        base_version,
+        left_version,
+        right_version,
+        teams,
     )
 
-    with open(os.devnull, "w") as devnull:
-        gpg = subprocess.Popen(
-            ["gpg", "--verify", filename],
-            stdout=devnull,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
-    stderr = gpg.communicate()[1]
-    if gpg.returncode != 0:
-        return None
-    for line in stderr.splitlines():
-        if "Good signature from" in line:
-            return line.split("Good signature from")[1].strip().strip('"')
-    return None
 
-def write_status_page(component, merges, left_distro, right_distro):
+def write_status_page(component, merges, sections, left_distro, right_distro):
     """Write out the merge status page."""
     status_file = "%s/merges/%s.html" % (ROOT, component)
 
-    try:
-        from pathlib import Path
-        agent_dir = Path("/var/lib/juju/agents/")
-        # Finds the first directory matching the pattern
-        charm_dir = next(agent_dir.glob("unit-ubuntu-merges-*")) / "charm"
-        revision = (charm_dir / "version").read_text().strip()
-    except (StopIteration, FileNotFoundError, PermissionError):
-        revision = "unknown"
+    revision = get_charm_revision()
+
+    # Find everybody's Launchpad page up front, a few at a time, rather
+    # than waiting on Launchpad for each row in turn.
+    people = set()
+    for merge in merges:
+        (user, uploader) = merge[3:5]
+        if user is None:
+            continue
+        (usr_name, usr_mail) = parseaddr(user)
+        people.add(usr_mail)
+        if uploader is not None:
+            (upl_name, upl_mail) = parseaddr(uploader)
+            if usr_name and usr_name != upl_name:
+                people.add(upl_mail)
+    prefetch_person_lp_pages(people)
+
+    by_section = {section: [] for section in sections}
+    for merge in merges:
+        by_section[merge[0]].append(merge)
 
     now_str = datetime.datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
     with tree.AtomicFile(status_file, "wt") as status:
-        print(
-            f"""<!DOCTYPE html>
-<html>
-<head>
-<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
-<title>Ubuntu Merge-o-Matic: {component}</title>
-<link href="https://fonts.googleapis.com/css?family=Ubuntu:300,400,500,700" rel="stylesheet">
-<style>
-    :root {{
-        --ubuntu-orange: #e95420;
-        --ubuntu-aubergine: #772953;
-        --text-color: #1a1a1a;
-        --bg-page: #f3f4f6;
-    }}
-    body {{
-        font-family: "Ubuntu", sans-serif;
-        background-color: var(--bg-page);
-        color: var(--text-color);
-        margin: 0;
-        padding: 20px;
-        line-height: 1.5;
-    }}
-    h1 {{
-        color: var(--ubuntu-aubergine);
-        border-bottom: 4px solid var(--ubuntu-orange);
-        padding-bottom: 10px;
-        margin-bottom: 30px;
-    }}
-    table {{
-        width: 100%;
-        border-collapse: separate;
-        border-spacing: 0;
-        background: white;
-        border: 2px solid #9ca3af;
-        box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.1);
-        border-radius: 8px;
-        overflow: hidden;
-    }}
-    th {{
-        background-color: #4b5563;
-        color: white;
-        text-align: left;
-        padding: 15px;
-        text-transform: uppercase;
-        font-size: 0.85em;
-        letter-spacing: 0.05em;
-    }}
-    td {{
-        padding: 12px 15px;
-        border-bottom: 1px solid rgba(0,0,0,0.1);
-        vertical-align: top;
-    }}
-    tr.first td {{
-        border-top: 2px solid #6b7280;
-    }}
-    input[type="text"] {{
-        border: 1px solid #9ca3af !important;
-        background-color: white !important;
-        padding: 6px;
-        border-radius: 3px;
-        color: #000;
-        width: 95%;
-    }}
-    a {{
-        color: #c2410c;
-        text-decoration: none;
-        font-weight: bold;
-    }}
-    a:hover {{
-        text-decoration: underline;
-    }}
-    .stats-container {{
-        display: flex;
-        flex-wrap: wrap;
-        justify-content: flex-start;
-        align-items: flex-start;
-        gap: 20px;
-        margin-top: 30px;
-        width: 100%;
-    }}
-
-    .stats-container img {{
-        box-sizing: border-box;
-        height: auto;
-        border: 1px solid #ddd;
-        border-radius: 4px;
-        box-shadow: 0 1px 4px rgba(0,0,0,0.1);
-        min-width: 300px;
-        flex: 0 1 auto;
-        max-width: 100%;
-    }}
-
-
-
-    .expanded {{
-        display: none;
-    }}
-
-    footer {{
-        margin-top: 50px;
-        padding: 20px 0;
-        border-top: 1px solid #eee;
-        font-size: 0.85rem;
-        color: #333;
-    }}
-</style>
-<%
-import html
-from momlib import *
-%>
-</head>
-<body>
-<div class="container">
-    <img src="./.static/img/ubuntulogo-100.png" id="ubuntu" alt="Ubuntu Logo">
-    <h1>Merge-o-Matic: {component}</h1>
-
-    <div id="filters">
-        <div style="margin-bottom: 10px;"><strong>Filters:</strong>
-            <input id="query" name="query" style="width: 300px;"/>
-        </div>
-        <label><input id="showProposed" checked="checked" type="checkbox"> Show Proposed</label> &nbsp;
-        <label><input id="showMergeNeeded" checked="checked" type="checkbox"> Show Merge Needed</label> &nbsp;
-        <label><input id="showLongBinaries" type="checkbox"> Show full binary list</label>
-    </div>
+        status.write(PAGE_HEADER.format(component=component))
 
-    <div id="navigation">
-              """,
-            file=status,
-        )
-
-        for section in SECTIONS:
-            section_merges = [m for m in merges if m[0] == section]
+        for section in sections:
             print(
-                f'<a href="#{section}" style="margin-right: 15px;">&rarr; {len(section_merges)} {section} merges</a>',
+                f'<a href="#{section}" style="margin-right: 15px;">&rarr; {len(by_section[section])} {section} merges</a>',
                 file=status,
             )
 
@@ -435,10 +432,15 @@ from momlib import *
             file=status,
         )
 
-        for section in SECTIONS:
-            section_merges = [m for m in merges if m[0] == section]
+        for section in sections:
             print(f'<h2 id="{section}">{section.title()} Merges</h2>', file=status)
-            do_table(status, section_merges, left_distro, right_distro, component)
+            do_table(
+                status,
+                by_section[section],
+                left_distro,
+                right_distro,
+                component,
+            )
 
         print(
             f"""
@@ -533,14 +535,13 @@ def do_table(status, merges, left_distro, right_distro, component):
         left_version,
         right_version,
         teams,
+        path_hash,
     ) in merges:
         colour_idx = get_importance(age)
         if user is not None:
             (usr_name, usr_mail) = parseaddr(user)
             user_lp_page = get_person_lp_page(usr_mail)
-            user = user.replace("&", "&amp;")
-            user = user.replace("<", "&lt;")
-            user = user.replace(">", "&gt;")
+            user = user.translate(HTML_ESCAPES)
             if user_lp_page:
                 who = "<a href='%s'>%s</a>" % (user_lp_page, user)
             else:
@@ -548,13 +549,10 @@ def do_table(status, merges, left_distro, right_distro, component):
 
             if uploader is not None:
                 (upl_name, upl_mail) = parseaddr(uploader)
-                upl_lp_page = get_person_lp_page(upl_mail)
 
                 if usr_name and usr_name != upl_name:
-                    u_who = uploader
-                    u_who = u_who.replace("&", "&amp;")
-                    u_who = u_who.replace("<", "&lt;")
-                    u_who = u_who.replace(">", "&gt;")
+                    upl_lp_page = get_person_lp_page(upl_mail)
+                    u_who = uploader.translate(HTML_ESCAPES)
                     if upl_lp_page:
                         who = (
                             "%s<br><small><em>Uploader:</em> "
@@ -577,122 +575,42 @@ def do_table(status, merges, left_distro, right_distro, component):
             # If there is a proposed verison we want to set the bg colour to
             # grey and display the version number.
             colour_idx = 6
+            proposed = ' (<a href="%s#%s">%s</a>)' % (
+                EXCUSES_URL,
+                package,
+                proposed_version,
+            )
+        else:
+            proposed = ""
 
-        print(
-            f"""
-        <tr bgcolor={COLOURS[colour_idx]} class=first>
-            <td>
-                <tt><a href="{pathhash(package)}/{package}/REPORT">{package}</a></tt>
-                <sup><a href="https://launchpad.net/ubuntu/+source/{package}">LP</a></sup>
-                <sup><a href="https://tracker.debian.org/{package}">PTS</a></sup>
-              """,
-            file=status,
-        )
-
-        cell_data = ""
         if teams:
-            cell_data += "["
-            cell_data += "%s" % ", ".join(t for t in teams)
-            cell_data += "]</td>"
+            teams_cell = "[%s]" % ", ".join(t for t in teams)
         else:
-            cell_data = "</td>"
-        print(cell_data, file=status)
+            teams_cell = ""
 
-        print(
-            f"""
-              <td colspan=3>{who}</td>
-              <td rowspan=2>
-                  <form method="get" action="addcomment.psp"><br />
-                      <input type="hidden" name="component" value="{component}" />
-                      <input type="hidden" name="package" value="{package}" />
-              """,
-            file=status,
-        )
-        print(
-            # The `start block` and `end block` are used to prevent mod_python's
-            # PSP handler from getting confused with the indentation.
-            # See https://modpython.org/live/current/doc-html/pythonapi.html#pyapi-psp
-            # for some details.
-            textwrap.dedent(
-                f"""\
-                <%
-                # start block
-                the_comment = ""
-                the_color = "white"
-                if "{package}" in comment:
-                    the_comment = comment["{package}"]
-                    the_color = "{COLOURS[colour_idx]}"
-                req.write(
-                    "<input type=\\"text\\" "
-                    "style=\\"border-style: none; background-color: %s\\" "
-                    "name=\\"comment\\" value=\\"%s\\" title=\\"%s\\" />" %
-                    (the_color, html.escape(the_comment, quote=True),
-                     html.escape(the_comment))
-                )
-                # end block
-                %>
-                """
-            ),
-            file=status,
-        )
-        print(
-            """
-            </form></td>
-            <td rowspan=2>
-            """,
-            file=status,
-        )
-        print(
-            textwrap.dedent(
-                f"""
-                <%
-                # start block
-                if "{package}" in comment:
-                    req.write("%s" % gen_buglink_from_comment(comment["{package}"]))
-                else:
-                    req.write("&nbsp;")
-                # end block
-                %>"""
-            ),
-            file=status,
-        )
-        print(
-            f"""
-            </td>
-            <td rowspan=2>
-            {age}
-            </td>
-            </tr>
-            <tr bgcolor="{COLOURS[colour_idx]}">
-              """,
-            file=status,
-        )
         # If the given package list is more than 10, hide it
-        if len(source["Binary"].strip().split(", ")) > 10:
-            print(
-                f"<td><small class='expanded'>{source['Binary']}</small></td>",
-                file=status,
-            )
+        binaries = BINARY_SEPARATOR.split(source["Binary"].strip())
+        if len(binaries) > 10:
+            binaries_class = " class='expanded'"
         else:
-            print(f"<td><small>{source['Binary']}</small></td>", file=status)
-        if proposed_version:
-            excuses_url = (
-                "https://ubuntu-archive-team.ubuntu.com/"
-                "proposed-migration/update_excuses.html"
-            )
-            print(
-                f'<td>{left_version} (<a href="{excuses_url}#{package}">{proposed_version}</a>)</td>',
-                file=status,
-            )
-        else:
-            print(f"<td>{left_version}</td>", file=status)
-        print(
-            f"""
-              <td>{right_version}</td>
-              <td>{base_version}</td>
-              </tr>
-              """,
-            file=status,
+            binaries_class = ""
+
+        status.write(
+            ROW_TEMPLATE.format(
+                colour=COLOURS[colour_idx],
+                component=component,
+                package=package,
+                path_hash=path_hash,
+                teams=teams_cell,
+                who=who,
+                age=age,
+                binaries_class=binaries_class,
+                binaries=source["Binary"],
+                left_version=left_version,
+                proposed=proposed,
+                right_version=right_version,
+                base_version=base_version,
+            ),
         )
 
     print("</table>", file=status)
@@ -713,21 +631,15 @@ def write_status_json(component, merges, left_distro, right_distro):
         left_version,
         right_version,
         teams,
+        path_hash,
     ) in merges:
-        who = None
         u_who = None
-        if user is not None:
-            who = user
-            who = who.replace("\\", "\\\\")
-            who = who.replace('"', '\\"')
-            if uploader is not None:
-                (usr_name, usr_mail) = parseaddr(user)
-                (upl_name, upl_mail) = parseaddr(uploader)
-                if usr_name and usr_name != upl_name:
-                    u_who = uploader
-                    u_who = u_who.replace("\\", "\\\\")
-                    u_who = u_who.replace('"', '\\"')
-        binaries = re.split(", *", source["Binary"].replace("\n", ""))
+        if user is not None and uploader is not None:
+            (usr_name, usr_mail) = parseaddr(user)
+            (upl_name, upl_mail) = parseaddr(uploader)
+            if usr_name and usr_name != upl_name:
+                u_who = uploader
+        binaries = BINARY_SEPARATOR.split(source["Binary"].replace("\n", ""))
         # source_package, short_description, and link are for
         # Harvest (http://daniel.holba.ch/blog/?p=838).
         data.append(
@@ -735,20 +647,33 @@ def write_status_json(component, merges, left_distro, right_distro):
                 "source_package": package,
                 "short_description": "merge %s" % right_version,
                 "link": "https://merges.ubuntu.com/%s/%s/"
-                % (pathhash(package), package),
+                % (path_hash, package),
                 "uploaded": uploaded,
                 "age": age,
-                "user": who,
+                "user": user,
                 "uploader": u_who,
-                "teams": list(teams),
+                "teams": sorted(teams),
                 "binaries": binaries,
-                "base_version": "%s" % base_version,
-                "left_version": "%s" % left_version,
-                "right_version": "%s" % right_version,
+                "base_version": base_version,
+                "left_version": left_version,
+                "right_version": right_version,
             },
         )
+    # Only the C encoder is fast, and it is only used for compact output
+    # encoded in one go
+    text = json.dumps(data, separators=(",", ":"), default=str)
+
+    # Most hourly runs find the same merges, leave the file alone then so
+    # that its modification time says when they last changed.
+    try:
+        with open(status_file) as status:
+            if status.read() == text:
+                return
+    except FileNotFoundError:
+        pass
+
     with tree.AtomicFile(status_file, "wt") as status:
-        status.write(json.dumps(data, indent=4))
+        status.write(text)
 
 
 def write_status_file(status_file, merges):
@@ -765,6 +690,7 @@ def write_status_file(status_file, merges):
             left_version,
             right_version,
             teams,
+            path_hash,
         ) in merges:
             print(
                 "%s %s %s %s %s %s, %s, %s"
@@ -17,9 +17,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import bz2
 import datetime
 import errno
 import fcntl
+import functools
 import json
 import logging
 import os
@@ -27,14 +29,16 @@ import re
 import stat
 import subprocess
 import sys
+import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
 from hashlib import md5
 from html import escape
 from optparse import OptionParser
 from typing import Dict
-from urllib.parse import quote
+from urllib.parse import quote, unquote_to_bytes
 from urllib.request import urlopen
 from xml.etree import ElementTree
 
@@ -81,9 +85,42 @@ SRC_DIST = "unstable"
 RSS_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S %Z"
 RSS_FALLBACK_TIME = "Thu, 01 Jan 1970 00:00:00 GMT"
 
+# Where juju keeps the agents, including the charm of this unit
+JUJU_AGENTS_DIR = "/var/lib/juju/agents"
+
+# Checking a signature needs neither the agent nor the trust database,
+# don't have gpg spend time starting or updating them for every dsc file.
+GPG_VERIFY = [
+    "gpg",
+    "--batch",
+    "--no-tty",
+    "--no-autostart",
+    "--no-auto-check-trustdb",
+    "--trust-model",
+    "always",
+    "--status-fd=1",
+    "--multifile",
+    "--verify",
+    "--",
+]
+
+# Number of files to check the signatures of with a single gpg
+GPG_BATCH_SIZE = 256
+
+# Seconds to wait for gpg to check a signature
+GPG_TIMEOUT = 15
+
+# gpg's machine readable output doesn't depend on the locale, but keep its
+# messages in English anyway
+GPG_ENV = dict(os.environ, LC_ALL="C")
+
 
 # Cache of parsed sources files
 SOURCES_CACHE = {}
+SOURCES_CACHE_LOCK = threading.Lock()
+
+# Cache of the sources files' paragraphs, indexed by package name
+SOURCES_INDEX = {}
 
 # mapping of uploader emails to Launchpad pages
 person_lp_page_mapping: Dict[str, str | None] = {}
@@ -169,6 +206,35 @@ def md5sum(filename):
     return md5(open(filename, "rb").read()).hexdigest()
 
 
+def person_lp_pages_file():
+    """Return the location of the saved Launchpad person pages."""
+    return "%s/person-lp-pages.json" % ROOT
+
+
+def read_person_lp_pages():
+    """Load the Launchpad person pages found by previous runs."""
+    try:
+        with open(person_lp_pages_file()) as lp_pages:
+            person_lp_page_mapping.update(json.load(lp_pages))
+    except (OSError, ValueError):
+        pass
+
+
+def write_person_lp_pages():
+    """Save the Launchpad person pages found so far.
+
+    Only actual pages are saved, people without one are looked up again
+    next time in case they have since joined Launchpad.
+    """
+    lp_pages = {
+        email: lp_page
+        for email, lp_page in person_lp_page_mapping.items()
+        if lp_page
+    }
+    with tree.AtomicFile(person_lp_pages_file(), "wt") as f:
+        json.dump(lp_pages, f)
+
+
 def get_person_lp_page(person_email):
     """Make a best guess at what the person's LP page is."""
     if person_email in person_lp_page_mapping:
@@ -198,6 +264,22 @@ def get_person_lp_page(person_email):
     return person_lp_page_mapping[person_email]
 
 
+def prefetch_person_lp_pages(person_emails, max_workers=16):
+    """Look up the Launchpad pages of several people at once.
+
+    The pages end up in the same mapping get_person_lp_page() uses, so
+    later calls for these people don't need to wait on Launchpad.
+    """
+    missing = {
+        email for email in person_emails if email not in person_lp_page_mapping
+    }
+    if not missing:
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(get_person_lp_page, missing):
+            pass
+
+
 def get_importance(days):
     """Return an int representing the importance of an item."""
     if days <= 30:
@@ -219,7 +301,9 @@ def get_responsible_team(source_package):
     """
     global package_team_mapping
     if not package_team_mapping:
-        package_team_mapping = defaultdict(set)
+        # Only publish the mapping once complete, it may be read from
+        # several threads.
+        mapping = defaultdict(set)
         mapping_file = "%s/package-team-mapping.json" % ROOT
         if os.path.exists(mapping_file):
             with open(mapping_file) as ptm_file:
@@ -227,7 +311,8 @@ def get_responsible_team(source_package):
                     if team == "unsubscribed":
                         continue
                     for package in packages:
-                        package_team_mapping[package].add(team)
+                        mapping[package].add(team)
+        package_team_mapping = mapping
     if source_package in package_team_mapping:
         return package_team_mapping[source_package]
     else:
@@ -292,6 +377,33 @@ def changes_file(distro, source):
     )
 
 
+def read_changed_by(filename):
+    """Return the Changed-By field of a changes file.
+
+    The changes file may be compressed.  Only the start of it is read,
+    the field comes well before the long Changes and Files fields.
+    """
+    # Most changes files are compressed, just try opening them rather than
+    # probing for each variant first.  A badly encoded line mustn't stop the
+    # whole status run, so decoding errors are replaced.
+    try:
+        changes = open(filename, encoding="utf-8", errors="replace")
+    except FileNotFoundError:
+        try:
+            changes = bz2.open(
+                filename + ".bz2", "rt", encoding="utf-8", errors="replace"
+            )
+        except FileNotFoundError:
+            return None
+
+    with changes:
+        for line in changes:
+            (field, sep, value) = line.partition(":")
+            if sep and field.lower() == "changed-by":
+                return value.strip()
+    return None
+
+
 def dpatch_directory(distro, source):
     """Return the directory where we put dpatches."""
     return "%s/dpatches/%s/%s/%s/%s" % (
@@ -397,23 +509,35 @@ def get_sources(distro, dist, component):
     global SOURCES_CACHE
 
     filename = sources_file(distro, dist, component)
-    if filename not in SOURCES_CACHE:
-        SOURCES_CACHE[filename] = ControlFile(
-            filename,
-            multi_para=True,
-            signed=False,
-        )
+    with SOURCES_CACHE_LOCK:
+        if filename not in SOURCES_CACHE:
+            SOURCES_CACHE[filename] = ControlFile(
+                filename,
+                multi_para=True,
+                signed=False,
+            )
 
     return SOURCES_CACHE[filename].paras
 
 
+def get_sources_index(distro, dist, component):
+    """Return the parsed Sources file as lists of sources by package."""
+    filename = sources_file(distro, dist, component)
+    sources = get_sources(distro, dist, component)
+    with SOURCES_CACHE_LOCK:
+        if filename not in SOURCES_INDEX:
+            index = defaultdict(list)
+            for source in sources:
+                index[source["Package"]].append(source)
+            SOURCES_INDEX[filename] = dict(index)
+
+    return SOURCES_INDEX[filename]
+
+
 def get_source(distro, dist, component, package):
     """Return the source for a package in a distro."""
-    sources = get_sources(distro, dist, component)
-    matches = []
-    for source in sources:
-        if source["Package"] == package:
-            matches.append(source)
+    sources_index = get_sources_index(distro, dist, component)
+    matches = list(sources_index.get(package, ()))
     if matches:
         version_sort(matches)
         return matches.pop()
@@ -576,6 +700,137 @@ def files(source):
     return [f.split(None, 2)[1:] for f in files]
 
 
+def dsc_file(distro, source):
+    """Return the location of the dsc file of a source in the pool."""
+    for _, name in files(source):
+        if name.endswith(".dsc"):
+            pooldir = pool_directory(distro, source["Package"])
+            return "%s/%s/%s" % (ROOT, pooldir, name)
+    return None
+
+
+def verify_signers(filenames):
+    """Return who signed each of the given files.
+
+    Files are checked with as few gpg runs as possible, files without a
+    good signature map to None.
+    """
+    signers = {}
+    remaining = list(filenames)
+    while remaining:
+        batch = remaining[:GPG_BATCH_SIZE]
+        try:
+            gpg = subprocess.run(
+                GPG_VERIFY + batch,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                env=GPG_ENV,
+                timeout=GPG_TIMEOUT * len(batch),
+            )
+        except subprocess.TimeoutExpired:
+            logging.warning("Timed out checking the signatures of %s", batch)
+            signers.update(dict.fromkeys(batch))
+            remaining = remaining[len(batch) :]
+            continue
+
+        # gpg reports on each file in turn between FILE_START and FILE_DONE
+        # (or FILE_ERROR) status lines, and gives up on the rest as soon as
+        # it finds a bad signature.
+        done = 0
+        current = None
+        for line in gpg.stdout.split(b"\n"):
+            (_, _, status) = line.partition(b"[GNUPG:] ")
+            keyword = status.split(b" ", 1)[0]
+            if keyword == b"FILE_START":
+                if current is not None:
+                    signers[current] = None
+                    done += 1
+                current = batch[done]
+                signer = None
+                bad = False
+            elif current is None:
+                continue
+            elif keyword == b"GOODSIG":
+                # GOODSIG <long keyid> <%XX escaped user id>
+                user_id = status.split(b" ", 2)[2]
+                signer = unquote_to_bytes(user_id).decode("utf-8", "replace")
+            elif keyword in (b"BADSIG", b"ERRSIG"):
+                bad = True
+            elif keyword in (b"FILE_DONE", b"FILE_ERROR"):
+                signers[current] = None if bad else signer
+                done += 1
+                current = None
+        if current is not None:
+            signers[current] = None
+            done += 1
+        if not done:
+            # gpg didn't get as far as the first file
+            signers.update(dict.fromkeys(batch))
+            done = len(batch)
+        remaining = remaining[done:]
+
+    return signers
+
+
+def uploader_cache_file():
+    """Return the location of the saved dsc file uploaders."""
+    return "%s/uploader-cache.json" % ROOT
+
+
+def read_uploader_cache():
+    """Read the cache of dsc file uploaders."""
+    try:
+        with open(uploader_cache_file()) as cache:
+            return json.load(cache)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_uploader_cache(uploader_cache):
+    """Write out the cache of dsc file uploaders.
+
+    Entries for dsc files which have since been expired from the pool
+    are dropped.
+    """
+    uploader_cache = {
+        filename: entry
+        for filename, entry in uploader_cache.items()
+        if os.path.exists(filename)
+    }
+    with tree.AtomicFile(uploader_cache_file(), "wt") as cache:
+        json.dump(uploader_cache, cache)
+
+
+def cached_signers(filenames, uploader_cache):
+    """Return who signed each of the given files.
+
+    Files whose modification time and size match their entry in
+    uploader_cache aren't checked again, the others are checked with
+    verify_signers and added to the cache.
+    """
+    signers = {}
+    stamps = {}
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            signers[filename] = None
+            continue
+
+        stamp = [st.st_mtime_ns, st.st_size]
+        entry = uploader_cache.get(filename)
+        if entry is not None and entry[:2] == stamp:
+            signers[filename] = entry[2]
+        else:
+            stamps[filename] = stamp
+
+    for filename, signer in verify_signers(list(stamps)).items():
+        uploader_cache[filename] = stamps[filename] + [signer]
+        signers[filename] = signer
+
+    return signers
+
+
 def read_basis(filename):
     """Read the basis version of a patch from a file."""
     basis_file = filename + "-basis"
@@ -709,14 +964,17 @@ def save_patch_file(filename, last, this):
 def read_report(output_dir, left_distro, right_distro):
     """Read the report to determine the versions that went into it."""
     filename = "%s/REPORT" % output_dir
-    if not os.path.isfile(filename):
+    # Most packages have a report, just try opening it
+    try:
+        report = open(filename)
+    except FileNotFoundError:
         raise ValueError("No report exists")
 
     base_version = None
     left_version = None
     right_version = None
 
-    with open(filename) as report:
+    with report:
         for line in report:
             if line.startswith("base:"):
                 base_version = Version(line[5:].strip())
@@ -737,12 +995,12 @@ def read_report(output_dir, left_distro, right_distro):
 
 
 def read_blocklist():
-    """Read the blocklist file."""
+    """Read the blocklist file into a set of package names."""
     filename = "%s/sync-blocklist.txt" % ROOT
     if not os.path.isfile(filename):
-        return []
+        return set()
 
-    bl = []
+    bl = set()
     with open(filename) as blocklist:
         for line in blocklist:
             try:
@@ -754,7 +1012,7 @@ def read_blocklist():
             if not line:
                 continue
 
-            bl.append(line)
+            bl.add(line)
 
     return bl
 
@@ -937,19 +1195,61 @@ def gen_buglink_from_comment(comment):
     return html
 
 
+def comment_field(comments, package, colour):
+    """Return the HTML comment input for a package's status row"""
+    if package in comments:
+        the_comment = comments[package]
+    else:
+        the_comment = ""
+        colour = "white"
+    return (
+        '<input type="text" style="border-style: none; background-color: %s" '
+        'name="comment" value="%s" title="%s" />'
+        % (colour, escape(the_comment, quote=True), escape(the_comment))
+    )
+
+
+def comment_buglink(comments, package):
+    """Return the HTML bug link cell content for a package's status row"""
+    if package in comments:
+        return gen_buglink_from_comment(comments[package])
+    return "&nbsp;"
+
+
+@functools.lru_cache(maxsize=None)
+def get_charm_revision():
+    """Return the revision of the deployed charm, or "unknown"."""
+    try:
+        for unit in os.listdir(JUJU_AGENTS_DIR):
+            if unit.startswith("unit-ubuntu-merges-"):
+                version_file = "%s/%s/charm/version" % (JUJU_AGENTS_DIR, unit)
+                with open(version_file) as version:
+                    return version.read().strip()
+    except OSError:
+        pass
+    return "unknown"
+
+
 # --------------------------------------------------------------------------- #
 # Launchpadlib functions
 # --------------------------------------------------------------------------- #
 
-LAUNCHPAD = None
+# launchpadlib objects are not thread-safe, so each thread gets its own
+LAUNCHPAD = threading.local()
 
+# The logins share launchpadlib's credential and cache directory, so they
+# are done one at a time
+LAUNCHPAD_LOGIN_LOCK = threading.Lock()
 
-def get_launchpad():
-    global LAUNCHPAD
 
-    if LAUNCHPAD is None:
-        LAUNCHPAD = Launchpad.login_anonymously("merge-o-matic", "production")
-    return LAUNCHPAD
+def get_launchpad():
+    if getattr(LAUNCHPAD, "lp", None) is None:
+        with LAUNCHPAD_LOGIN_LOCK:
+            LAUNCHPAD.lp = Launchpad.login_anonymously(
+                "merge-o-matic",
+                "production",
+            )
+    return LAUNCHPAD.lp
 
 
 def get_date_superseded(package, base_version):
@@ -1013,29 +1313,17 @@ def proposed_package_version(package, our_version):
     return proposed_pkg
 
 
-def download_source(distro, source, targetdir):
-    for size, name in files(source):
-        # We compose the URL manually rather than going through launchpadlib
-        # to save several round-trips.
-        url = (
-            "https://launchpad.net/%s/+archive/primary/"
-            "+sourcefiles/%s/%s/%s"
-            % (
-                quote(distro),
-                quote(source["Package"]),
-                quote(source["Version"]),
-                quote(name),
-            )
+def source_file_url(distro, source, name):
+    """Return the Launchpad URL of one of a source's files."""
+    # We compose the URL manually rather than going through launchpadlib
+    # to save several round-trips.
+    return (
+        "https://launchpad.net/%s/+archive/primary/"
+        "+sourcefiles/%s/%s/%s"
+        % (
+            quote(distro),
+            quote(source["Package"]),
+            quote(source["Version"]),
+            quote(name),
         )
-        filename = os.path.join(targetdir, name)
-
-        logging.debug("Downloading %s", url)
-        ensure(filename)
-        try:
-            with closing(urlopen(url)) as url_f, open(filename, "wb") as out_f:
-                for chunk in iter(lambda: url_f.read(256 * 1024), ""):
-                    out_f.write(chunk)
-        except OSError:
-            logging.warning("Downloading %s failed", url)
-            raise
-        logging.info("Saved %s", name)
+    )
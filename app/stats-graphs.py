@@ -19,11 +19,13 @@
 import calendar
 import datetime
 import logging
+from collections import defaultdict
 
 from momlib import DISTROS, OUR_DISTRO, ROOT, run
 
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import numpy as np
 
 logging.getLogger("matplotlib").setLevel(logging.WARNING)
 
@@ -90,6 +92,12 @@ def main(options, args):
     start = trend_start(today)
     events = get_events(stats, start)
 
+    # Setting up a figure costs more than drawing these charts, so draw
+    # every component's charts on the same two figures.
+    (pie_fig, pie_ax) = plt.subplots(figsize=(7, 7))
+    # figsize in inches (900x450 pixels)
+    (range_fig, range_ax) = plt.subplots(figsize=(12, 6))
+
     # Iterate the components and calculate the peaks over the last six
     # months, as well as the current stats
     for component in DISTROS[distro]["components"]:
@@ -97,8 +105,10 @@ def main(options, args):
         current = get_current(stats[component])
         history = get_history(stats[component], start)
 
-        pie_chart(component, current)
-        range_chart(component, history, start, today, events)
+        pie_chart(pie_ax, component, current)
+        range_chart(range_ax, component, history, start, today, events)
+
+    plt.close("all")
 
 
 def date_to_datetime(s):
@@ -135,16 +145,12 @@ def trend_start(today):
 
 def read_stats():
     """Read the stats history file."""
-    stats = {}
+    stats = defaultdict(list)
 
     stats_file = "%s/stats.txt" % ROOT
     with open(stats_file) as stf:
         for line in stf:
             (date, time, component, info) = line.strip().split(" ", 3)
-
-            if component not in stats:
-                stats[component] = []
-
             stats[component].append([date, time, info])
 
     return stats
@@ -154,9 +160,11 @@ def get_events(stats, start):
     """Get the list of interesting events."""
     events = []
 
+    # ISO dates sort the same as strings, so there's no need to parse them
+    start = start.isoformat()
     if "event" in stats:
         for date, time, info in stats["event"]:
-            if date_to_datetime(date) >= start:
+            if date >= start:
                 events.append((date, info))
 
     return events
@@ -184,13 +192,15 @@ def get_current(stats):
 def get_history(stats, start):
     """Get historical information for each day since start."""
     values = {}
+    start = start.isoformat()
     for date, time, info in stats:
-        if date_to_datetime(date) >= start:
+        if date >= start:
             values[date] = info
 
-    dates = sorted(values)
-
-    return [(d, values[d]) for d in dates]
+    # stats.txt is appended to in order, so the dates are normally already
+    # sorted and sorting them again only takes a single pass; it is kept in
+    # case the file ever gets an out of order line.
+    return sorted(values.items())
 
 
 def date_tics(min, max):
@@ -217,7 +227,7 @@ def sources_intervals(max):
         return (1, None)
 
 
-def pie_chart(component, current):
+def pie_chart(ax, component, current):
     """Output a pie chart for the given component and data."""
     values = info_to_data(None, current)
     labels = [LABELS[key] for key in ORDER]
@@ -225,8 +235,7 @@ def pie_chart(component, current):
     explode = [ARC_OFFSETS[key] / 100.0 for key in ORDER]
     colors = [FILL_STYLES[key] for key in ORDER]
 
-    fig, ax = plt.subplots(figsize=(7, 7))
-
+    ax.clear()
     ax.pie(
         values,
         explode=explode,
@@ -241,30 +250,33 @@ def pie_chart(component, current):
     ax.axis("equal")
 
     filename = f"{ROOT}/merges/{component}-now.png"
-    plt.savefig(filename, bbox_inches="tight")
-    plt.close(fig)
+    ax.figure.savefig(filename, bbox_inches="tight")
 
 
-def range_chart(component, history, start, today, events):
+def range_chart(ax, component, history, start, today, events):
     """Output a range chart for the given component and data."""
-
-    data_list = [info_to_data(date, info) for date, info in history]
-
-    if not data_list:
+    if not history:
         return
 
-    dates_ordinal = [date_to_datetime(d[0]) for d in data_list]
-    raw_values = [[d[i] for d in data_list] for i in range(1, 7)]
+    dates = np.array([date_to_datetime(date) for date, info in history])
+    # One row per day, one column per stat
+    values = np.array([info_to_data(None, info) for date, info in history])
+
+    # Days in the middle of a run of identical stats add nothing to the
+    # plot, only drop those so the start and end of each run are kept
+    same = np.all(values[1:] == values[:-1], axis=1)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:-1] = ~(same[:-1] & same[1:])
+    dates = dates[keep]
+    values = values[keep]
 
     colors = [FILL_STYLES[key] for key in ORDER]
     labels = [LABELS[key] for key in ORDER]
 
-    # figsize in inches (900x450 pixels)
-    fig, ax = plt.subplots(figsize=(12, 6))
-
+    ax.clear()
     ax.stackplot(
-        dates_ordinal,
-        *raw_values,
+        dates,
+        values.T,
         labels=labels,
         colors=colors,
         edgecolor="black",
@@ -276,10 +288,10 @@ def range_chart(component, history, start, today, events):
     ax.xaxis.set_major_locator(mdates.MonthLocator(bymonthday=1))
     ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %y"))
 
-    plt.xticks(rotation=45, ha="right", fontsize=9)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right", fontsize=9)
     ax.set_xlabel("Date", fontsize=10)
 
-    max_y = max(sum(y) for y in zip(*raw_values)) if raw_values else 10
+    max_y = values.sum(axis=1).max()
     y_major, y_minor = sources_intervals(max_y)
 
     ax.yaxis.set_major_locator(plt.MultipleLocator(y_major))
@@ -295,13 +307,16 @@ def range_chart(component, history, start, today, events):
     levels = {}
     y_limit = ax.get_ylim()[1]
 
-    for date_str, text in events:
-        d_ord = date_to_ordinal(date_str)
+    # Transform all the event positions to pixels in one call
+    d_ords = np.array([date_to_ordinal(date) for date, text in events])
+    xs_pix = ax.transData.transform(
+        np.column_stack([d_ords, np.zeros_like(d_ords)])
+    )[:, 0]
 
+    for (date_str, text), d_ord, x_pix in zip(events, d_ords, xs_pix):
         ax.axvline(
             x=d_ord, color="black", linestyle="--", linewidth=0.7, alpha=0.5
         )
-        x_pix, _ = ax.transData.transform((d_ord, 0))
 
         level = 0
         while level < 3:
@@ -329,8 +344,7 @@ def range_chart(component, history, start, today, events):
         levels[level] = x_pix + (len(text) * 6) + 20
 
     filename = f"{ROOT}/merges/{component}-trend.png"
-    plt.savefig(filename, bbox_inches="tight", dpi=100)
-    plt.close(fig)
+    ax.figure.savefig(filename, bbox_inches="tight", dpi=100)
 
 
 if __name__ == "__main__":
@@ -34,16 +34,12 @@ def as_dir(path):
 
 def as_file(path):
     """Return the path without a trailing slash."""
-    while path[-1:] == "/":
-        path = path[:-1]
-    return path
+    return path.rstrip("/")
 
 
 def relative(path):
     """Return the path without a leading slash."""
-    while path[:1] == "/":
-        path = path[1:]
-    return path
+    return path.lstrip("/")
 
 
 def under(root, path):
@@ -73,26 +69,63 @@ def walk(path, topdown=True, relative=True):
 
     If relative is False the path is not stripped from the directory name.
     """
-    for dirpath, dirnames, filenames in os.walk(path, topdown=topdown):
-        if relative:
-            base = subdir(path, dirpath)
-        else:
-            base = dirpath
-
-        if topdown:
-            yield base
-
-        for filename in filenames:
-            yield os.path.join(base, filename)
-
-        # os.walk doesn't check for symlinks, so we do
-        for dirname in list(dirnames):
-            if os.path.islink(os.path.join(dirpath, dirname)):
-                dirnames.remove(dirname)
-                yield os.path.join(base, dirname)
-
-        if not topdown:
-            yield base
+    if relative:
+        base = ""
+    else:
+        base = path
+    return _walk(path, base, topdown)
+
+
+def _walk(dirpath, base, topdown):
+    """Walk the directory at dirpath, naming its contents under base."""
+    # Use the file types scandir already found rather than checking each
+    # entry again, directories that can't be listed are skipped like
+    # os.walk does.
+    filenames = []
+    dirnames = []
+    linknames = []
+    try:
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    filenames.append(entry.name)
+                elif entry.is_symlink():
+                    linknames.append(entry.name)
+                else:
+                    dirnames.append(entry.name)
+    except OSError:
+        return
+
+    if topdown:
+        yield base
+    else:
+        for dirname in dirnames:
+            yield from _walk(
+                os.path.join(dirpath, dirname),
+                os.path.join(base, dirname),
+                topdown,
+            )
+
+    for filename in filenames:
+        yield os.path.join(base, filename)
+
+    # Symlinks to directories are returned as they are, not followed
+    for linkname in linknames:
+        yield os.path.join(base, linkname)
+
+    if topdown:
+        for dirname in dirnames:
+            yield from _walk(
+                os.path.join(dirpath, dirname),
+                os.path.join(base, dirname),
+                topdown,
+            )
+    else:
+        yield base
 
 
 def copytree(path, newpath, link=False, dereference=False):
@@ -103,13 +136,39 @@ def copytree(path, newpath, link=False, dereference=False):
     preserved unless dereference is True.  All other permissions are
     retained.
     """
-    for filename in walk(path):
-        copyfile(
-            os.path.join(path, filename),
-            os.path.join(newpath, filename),
-            link=link,
-            dereference=dereference,
-        )
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return
+
+    # This replaces anything already at newpath, so everything below it can
+    # be created without checking what is there first.  The trailing slash
+    # makes a symlinked path be copied as the directory it points to.
+    copyfile(as_dir(path), newpath, link=link, dereference=dereference)
+    _copyentries(entries, newpath, link, dereference)
+
+
+def _copyentries(entries, newpath, link, dereference):
+    """Copy the directory entries into the new, empty, directory newpath."""
+    for entry in entries:
+        dstpath = os.path.join(newpath, entry.name)
+        if entry.is_symlink() and not dereference:
+            os.symlink(os.readlink(entry.path), dstpath)
+        elif entry.is_dir():
+            os.mkdir(dstpath)
+            # Symlinked directories are made but not followed, as in walk()
+            if not entry.is_symlink():
+                try:
+                    subentries = list(os.scandir(entry.path))
+                except OSError:
+                    continue
+                _copyentries(subentries, dstpath, link, dereference)
+        elif stat.S_ISFIFO(entry.stat().st_mode):
+            os.mkfifo(dstpath)
+        elif link:
+            os.link(entry.path, dstpath)
+        else:
+            shutil.copy2(entry.path, dstpath)
 
 
 def copyfile(srcpath, dstpath, link=False, dereference=False):
@@ -168,6 +227,30 @@ class AtomicFile:
         return self.fd
 
     def __exit__(self, exc_type, unused_exc_value, unused_exc_tb):
-        self.fd.close()
-        if exc_type is None:
-            os.rename("%s.new" % self.filename, self.filename)
+        new_filename = "%s.new" % self.filename
+        try:
+            try:
+                if exc_type is None:
+                    self.fd.flush()
+                    os.fsync(self.fd.fileno())
+            finally:
+                self.fd.close()
+            if exc_type is None:
+                os.replace(new_filename, self.filename)
+        except BaseException:
+            remove(new_filename)
+            raise
+
+        if exc_type is not None:
+            remove(new_filename)
+            return
+
+        # Sync the directory as well, or the rename itself may be lost
+        dir_fd = os.open(
+            os.path.dirname(self.filename) or ".",
+            os.O_RDONLY | os.O_DIRECTORY,
+        )
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
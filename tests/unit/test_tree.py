@@ -0,0 +1,28 @@
+# Copyright 2025 Canonical
+# See LICENSE file for licensing details.
+
+import importlib.util
+import os
+from pathlib import Path
+
+TREE_PY = Path(__file__).parents[2] / "app" / "util" / "tree.py"
+spec = importlib.util.spec_from_file_location("tree", TREE_PY)
+tree = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tree)
+
+
+def test_copytree_symlinked_source(tmp_path):
+    src = tmp_path / "src"
+    (src / "subdir").mkdir(parents=True)
+    (src / "file").write_text("data")
+    os.symlink("nowhere", src / "broken")
+    os.symlink("src", tmp_path / "srclink")
+
+    tree.copytree(str(tmp_path / "srclink"), str(tmp_path / "copy"))
+
+    copy = tmp_path / "copy"
+    assert copy.is_dir() and not copy.is_symlink()
+    assert sorted(os.listdir(copy)) == ["broken", "file", "subdir"]
+    assert (copy / "file").read_text() == "data"
+    assert os.readlink(copy / "broken") == "nowhere"
+    assert sorted(os.listdir(src)) == ["broken", "file", "subdir"]